@@ -0,0 +1,137 @@
+import json
+import mmap
+import struct
+from pathlib import Path
+
+MAGIC = b"BAROQUE1"
+# magic, folder table offset, folder table length, index offset
+HEADER = struct.Struct("<8sQQQ")
+# present flag, then french, english and image (offset, length) pairs of one
+# page slot
+RECORD = struct.Struct("<IQIQIQI")
+
+
+def pack_archive(raw_data: dict, archive_path: Path):
+    """
+    Pack the page texts and images of import_raw_files output into a single
+    file. Layout: header, page data blobs, a fixed-width index with one slot
+    per page number of every folder, and a JSON folder table giving each
+    folder's first slot and slot count. Missing pages have empty slots.
+    """
+    folders = []
+    records = []
+    with open(archive_path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, 0, 0, 0))
+        for folder, files in raw_data.items():
+            slots = {}
+            for fren, eng, im in files:
+                page = int(im.stem.removeprefix("page_"))
+                entry = [1]
+                for path in (fren, eng, im):
+                    data = path.read_bytes() if path.exists() else b""
+                    entry.extend([f.tell(), len(data)])
+                    f.write(data)
+                slots[page] = entry
+            n_slots = max(slots, default=0)
+            folders.append([folder, len(records), n_slots])
+            for page in range(1, n_slots + 1):
+                records.append(slots.get(page, [0] * 7))
+
+        index_offset = f.tell()
+        for r in records:
+            f.write(RECORD.pack(*r))
+        table_offset = f.tell()
+        table = json.dumps(folders).encode("utf-8")
+        f.write(table)
+        f.seek(0)
+        f.write(HEADER.pack(MAGIC, table_offset, len(table), index_offset))
+
+
+class PackedArchive:
+    """
+    Memory-mapped reader for a packed corpus archive. Any folder/page is
+    found in O(1) from the folder table and fixed-width index, and images
+    are returned as views onto the mapping rather than copies.
+    """
+
+    def __init__(self, archive_path: Path):
+        with open(archive_path, "rb") as f:
+            self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.view = memoryview(self.mm)
+        magic, table_offset, table_len, self.index_offset = HEADER.unpack_from(
+            self.mm, 0
+        )
+        if magic != MAGIC:
+            raise ValueError(f"{archive_path} is not a baroque archive")
+        table = json.loads(self.mm[table_offset : table_offset + table_len])
+        self.folders = {name: (first, n) for name, first, n in table}
+
+    def close(self):
+        try:
+            self.view.release()
+            self.mm.close()
+        except BufferError:
+            # callers still hold page views, the mapping closes once they go
+            pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_exc):
+        self.close()
+
+    def _record(self, folder: str, page: int):
+        first, n = self.folders[folder]
+        if not 1 <= page <= n:
+            raise KeyError(f"{folder} has no page {page}")
+        offset = self.index_offset + (first + page - 1) * RECORD.size
+        return RECORD.unpack_from(self.mm, offset)
+
+    def pages(self, folder: str) -> list[int]:
+        """Page numbers present in a folder"""
+        _first, n = self.folders[folder]
+        return [p for p in range(1, n + 1) if self._record(folder, p)[0]]
+
+    def read(self, folder: str, page: int) -> tuple[str, str, memoryview]:
+        """French text, English text and JPEG image of a page"""
+        present, fr_off, fr_len, en_off, en_len, im_off, im_len = self._record(
+            folder, page
+        )
+        if not present:
+            raise KeyError(f"{folder} has no page {page}")
+        french = str(self.view[fr_off : fr_off + fr_len], "utf-8")
+        english = str(self.view[en_off : en_off + en_len], "utf-8")
+        return french, english, self.view[im_off : im_off + im_len]
+
+    def raw_files(self, folders=None) -> dict:
+        """Pages as read_raw_files gives them, straight from the archive"""
+        return {
+            folder: self._raw_pages(folder)
+            for folder in self.folders
+            if folders is None or folder in folders
+        }
+
+    def _raw_pages(self, folder: str):
+        for page in self.pages(folder):
+            french, english, image = self.read(folder, page)
+            yield french, english, f"page_{page:03d}.jpg", image
+
+    def unpack(self, output_dir: Path, folders=None):
+        """Write the archive back out in the raw-output layout"""
+        for folder in self.folders:
+            if folders is not None and folder not in folders:
+                continue
+            image_folder = output_dir / folder / "images"
+            image_folder.mkdir(parents=True, exist_ok=True)
+            for page in self.pages(folder):
+                french, english, image = self.read(folder, page)
+                text_folder = output_dir / folder
+                french_path = text_folder / f"french_page_{page:03d}.txt"
+                english_path = text_folder / f"english_page_{page:03d}.txt"
+                with open(french_path, "w", encoding="utf-8") as f:
+                    f.write(french)
+                with open(english_path, "w", encoding="utf-8") as f:
+                    f.write(english)
+                if len(image) > 0:
+                    with open(image_folder / f"page_{page:03d}.jpg", "wb") as f:
+                        f.write(image)
@@ -1,8 +1,9 @@
 from dataclasses import dataclass
 
 
-@dataclass
+@dataclass(slots=True)
 class BaroqueInputImage:
+    """A JPEG encoded page"""
 
     page: int
     filename: str
@@ -13,6 +14,14 @@ class BaroqueInputImage:
     original_width: int
     original_height: int
 
+    def __setstate__(self, state):
+        # pages cached in the baroque shelve before the class had slots were
+        # pickled with a __dict__ rather than slot state
+        if isinstance(state, tuple):
+            _dict_state, state = state
+        for name, value in state.items():
+            object.__setattr__(self, name, value)
+
 
 @dataclass
 class BaroquePage:
@@ -21,6 +30,10 @@ class BaroquePage:
     french_text: str
     english_latex: str
     french_latex: str
+    ocr_resolution: int = 0
+    ocr_model: str = ""
+    translation_model: str = ""
+    truncated: bool = False
 
 
 # BaroqueInputImage = namedtuple(
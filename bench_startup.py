@@ -0,0 +1,71 @@
+"""
+Startup-time benchmark for main.py. Each command is run in a fresh
+interpreter; the check fails if its median startup time exceeds the budget
+or it imports a heavy dependency it doesn't need.
+
+    python bench_startup.py --budget 0.5
+"""
+
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import click
+
+from main import main as cli
+
+MAIN = Path(__file__).parent / "main.py"
+HEAVY_MODULES = ["anthropic", "PIL", "pypdf"]
+
+# every subcommand should start without any heavy dependency
+COMMANDS = [["--help"]] + [[name, "--help"] for name in sorted(cli.commands)]
+
+
+def _imported_modules(args: list[str]) -> set[str]:
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", str(MAIN)] + args,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    modules = set()
+    for line in result.stderr.splitlines():
+        if line.startswith("import time:") and "|" in line:
+            modules.add(line.rsplit("|", 1)[1].strip().split(".")[0])
+    return modules
+
+
+def _startup_time(args: list[str], repeats: int) -> float:
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        subprocess.run(
+            [sys.executable, str(MAIN)] + args, capture_output=True, check=True
+        )
+        times.append(time.perf_counter() - start)
+    return statistics.median(times)
+
+
+@click.command()
+@click.option("--budget", default=0.5, help="Maximum median startup in seconds")
+@click.option("--repeats", default=5, help="Runs per command")
+def bench(budget, repeats):
+    failed = False
+    for args in COMMANDS:
+        name = " ".join(args)
+        heavy = sorted(set(HEAVY_MODULES) & _imported_modules(args))
+        seconds = _startup_time(args, repeats)
+        ok = seconds <= budget and not heavy
+        failed = failed or not ok
+        status = "ok" if ok else "FAIL"
+        print(f"{name:<20}{seconds * 1000:>8.0f} ms  {status}")
+        if heavy:
+            print(f"    imports {', '.join(heavy)}")
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    bench()
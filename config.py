@@ -1,4 +1,52 @@
-longside_res = 800
+# OCR is attempted at the lowest resolution first, and only re-submitted at
+# the next one up when the transcription looks weak. Pages are ingested at
+# the highest resolution of the ladder. The ladder starts at the 800 px the
+# corpus was transcribed at; a lower rung needs showing not to lose text
+# first, as few weak transcriptions are detected to escalate from it.
+OCR_RESOLUTIONS = [800, 1200]
+longside_res = OCR_RESOLUTIONS[-1]
+
+# escalate OCR to a higher resolution when more than this fraction of the
+# words are marked illegible. Short transcriptions are not escalated: dates,
+# addresses and blank pages are common and more pixels don't lengthen them.
+OCR_MAX_ILLEGIBLE_RATIO = 0.1
+
+# model routing: short texts are translated by the lite model first. OCR
+# always uses the full model, as blank-row gaps and ink density don't tell
+# printed from handwritten pages in this corpus (it has no printed pages).
+ROUTE_LITE_MAX_FRENCH_CHARS = 1500
+
+# page features are measured against the paper grey level (this percentile of
+# the page), so faded or dark scans and black scanner borders don't swallow
+# the gaps between lines. Ratios were calibrated against raw-output line counts.
+PAPER_PERCENTILE = 0.9
+MARGIN_RATIO = 0.7
+INK_RATIO = 0.65
+LINE_GAP_RATIO = 0.35
+
+# max_tokens budgets estimated per page, doubled on a max_tokens stop up to
+# the cap. Larger non-streaming requests are refused by the client.
+OCR_BASE_TOKENS = 3000
+OCR_TOKENS_PER_LINE = 150
+TRANSLATION_BASE_TOKENS = 1500
+TRANSLATION_TOKENS_PER_CHAR = 1.0
+MAX_TOKENS_CAP = 20000
+
+# sentences must have been seen this often, with at least this many words,
+# to enter the translation memory. Pages are only used to build it when
+# every English sentence is within this length ratio of its French one.
+TM_MIN_OCCURRENCES = 3
+TM_MIN_WORDS = 3
+TM_MAX_LENGTH_RATIO = 2.0
+
+# widths of the page thumbnails in the obsidian vault. Notes embed pages at
+# 400 and 500 px, each using the smallest thumbnail at least that wide; a
+# single 500 px size keeps the vault smallest.
+VAULT_THUMBNAIL_WIDTHS = [500]
+VAULT_THUMBNAIL_QUALITY = 85
+
+# watch mode waits for scans to stop changing before queueing them
+WATCH_SETTLE_SECONDS = 30
 
 MODEL_ID = "claude-sonnet-4-5"
 LITE_MODEL_ID = "claude-haiku-4-5"
@@ -47,6 +95,10 @@ Remember, your goal is to provide the most accurate transcription possible while
 Here is the text to translate:
 """
 
+TRANSLATION_HINTS_PROMPT = """
+Some sentences of this text have been translated before. Use these established translations, given as French => English, wherever the sentences occur:
+"""
+
 FORMAT_PROMPT = """
 Your task is to convert a plain text extract with meaningful whitespace to a LaTeX-formatted text extract. The input text may be in French or English and contains meaningful whitespace, tables, and paragraph breaks.
 
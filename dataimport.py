@@ -1,31 +1,92 @@
 import io
+import json
+import os
 import re
+import tempfile
 from pathlib import Path
 
 from PIL import Image
-from pypdf import PdfReader
 
 import config as cfg
+import profiling
 from base import BaroqueInputImage
 
+# page indexes live in the working directory, as input_data may be read only
+PAGE_INDEX_DIR = Path("page-index")
 
-def _notebook_images(sorted_pdf_files: list[Path]):
+
+def _pdf_signature(pdf_file: Path) -> list:
+    stat = pdf_file.stat()
+    return [pdf_file.name, stat.st_size, stat.st_mtime_ns]
+
+
+def load_page_index(folder: Path, sorted_pdf_files: list[Path]) -> list[list]:
     """
-    generator of images from all pdfs in a notebook
+    Index of a notebook mapping global page number (position + 1) to
+    [pdf filename, page index, image index]. Persisted in PAGE_INDEX_DIR
+    under the folder name and rebuilt whenever the set of pdfs or any of their
+    sizes/mtimes change. Counting images only reads the page resources, not
+    the image streams.
     """
-    i = 1
+    index_path = PAGE_INDEX_DIR / f"{folder.name}.json"
+    signature = [_pdf_signature(f) for f in sorted_pdf_files]
+    if index_path.exists():
+        with open(index_path, "r", encoding="utf-8") as f:
+            index = json.load(f)
+        if index["files"] == signature:
+            return index["pages"]
+
+    # pypdf is slow to import and only needed for ingesting pdfs
+    from pypdf import PdfReader
+
+    print(f"Building page index for {folder.name}...")
+    pages = []
     for pdf_file in sorted_pdf_files:
         reader = PdfReader(pdf_file)
-        for _page_num, page in enumerate(reader.pages, start=1):
-            for _img_num, image_file_object in enumerate(page.images, start=1):
-                yield (i, image_file_object, pdf_file)
-                i += 1
+        for page_num, page in enumerate(reader.pages):
+            for img_num in range(len(page.images)):
+                pages.append([pdf_file.name, page_num, img_num])
+    # write then rename, as concurrent workers may be reading the index
+    PAGE_INDEX_DIR.mkdir(parents=True, exist_ok=True)
+    with tempfile.NamedTemporaryFile(
+        "w", encoding="utf-8", dir=PAGE_INDEX_DIR, suffix=".tmp", delete=False
+    ) as f:
+        json.dump({"files": signature, "pages": pages}, f)
+    os.replace(f.name, index_path)
+    return pages
 
 
-def import_raw_files(data_dir: Path):
-    """Find the processed files for doing obsidian and things like that"""
-    folders = list(Path(data_dir).glob("*/"))
-    sorted_folders = sorted(folders, key=lambda x: _natural_sort_key(x.stem))
+def _notebook_images(folder: Path, sorted_pdf_files: list[Path], pages=None):
+    """
+    generator of images from all pdfs in a notebook, optionally restricted to
+    a collection of global page numbers. Uses the page index to jump directly
+    to the requested images, and only keeps one pdf reader open at a time.
+    """
+    from pypdf import PdfReader
+
+    index = load_page_index(folder, sorted_pdf_files)
+    reader = None
+    reader_file = None
+    for i, (pdf_name, page_num, img_num) in enumerate(index, start=1):
+        if pages is not None and i not in pages:
+            continue
+        pdf_file = folder / pdf_name
+        if pdf_file != reader_file:
+            reader = PdfReader(pdf_file)
+            reader_file = pdf_file
+        with profiling.span("pdf_extract", f"{folder.name}|{pdf_name}|{i}") as sp:
+            image_file_object = reader.pages[page_num].images[img_num]
+            sp.nbytes = len(image_file_object.data)
+        yield (i, image_file_object, pdf_file)
+
+
+def import_raw_files(data_dir: Path, folders=None):
+    """Find the processed files for doing obsidian and things like that,
+    optionally only for the named folders"""
+    all_folders = list(Path(data_dir).glob("*/"))
+    if folders is not None:
+        all_folders = [f for f in all_folders if f.name in folders]
+    sorted_folders = sorted(all_folders, key=lambda x: _natural_sort_key(x.stem))
 
     files = {}
     for f in sorted_folders:
@@ -43,57 +104,132 @@ def import_raw_files(data_dir: Path):
     return files
 
 
-def all_files(data_dir: Path):
+def read_raw_files(data_dir: Path, folders=None) -> dict:
+    """import_raw_files with each page lazily loaded as (french text,
+    english text, image name, image path)"""
+    return {
+        folder: (_read_raw_page(*f) for f in files)
+        for folder, files in import_raw_files(data_dir, folders).items()
+    }
+
+
+def _read_raw_page(french_path: Path, english_path: Path, image_path: Path):
+    with profiling.span("read_text", french_path.parent.name):
+        with open(french_path, "r", encoding="utf-8") as f:
+            french = f.read()
+        with open(english_path, "r", encoding="utf-8") as f:
+            english = f.read()
+    return french, english, image_path.name, image_path
+
+
+def read_routing(routing_path: Path) -> dict[int, list[str]]:
+    """Routing decisions of a folder's routing.tsv by page, keeping the
+    last row recorded for each page"""
+    rows = {}
+    with open(routing_path, "r", encoding="utf-8") as f:
+        for line in f:
+            page, *fields = line.rstrip("\n").split("\t")
+            rows[int(page)] = fields
+    return dict(sorted(rows.items()))
+
+
+IMAGE_PATTERNS = ["*.jpg", "*.JPG", "*.jpeg", "*.JPEG"]
+PDF_PATTERNS = ["*.pdf", "*.PDF"]
+
+
+def folder_files(folder: Path) -> tuple[list[Path], list[Path]]:
+    """Naturally sorted image and pdf files of a notebook folder"""
+    images = []
+    pdfs = []
+    for p in IMAGE_PATTERNS:
+        images.extend(folder.glob(p))
+    for p in PDF_PATTERNS:
+        pdfs.extend(folder.glob(p))
+    sorted_images = sorted(images, key=lambda x: _natural_sort_key(x.stem))
+    sorted_pdfs = sorted(pdfs, key=lambda x: _natural_sort_key(x.stem))
+    assert len(sorted_images) == 0 or len(sorted_pdfs) == 0
+    return sorted_images, sorted_pdfs
+
+
+def scan_inputs(data_dir: Path) -> dict[str, list[int]]:
+    """Manifest of every input scan as "folder/filename" -> [size, mtime]"""
+    manifest = {}
+    for folder in Path(data_dir).glob("*/"):
+        sorted_images, sorted_pdfs = folder_files(folder)
+        for f in sorted_images + sorted_pdfs:
+            stat = f.stat()
+            manifest[f"{folder.name}/{f.name}"] = [stat.st_size, stat.st_mtime_ns]
+    return manifest
+
+
+def page_filenames(folder: Path) -> list[str]:
+    """Source filename of every page of a notebook, in page order"""
+    sorted_images, sorted_pdfs = folder_files(folder)
+    if len(sorted_pdfs) > 0:
+        return [pdf_name for pdf_name, _, _ in load_page_index(folder, sorted_pdfs)]
+    return [img_path.name for img_path in sorted_images]
+
+
+def first_page_of(page_names: list[str], filename: str) -> int:
+    """Page number at which filename's pages start among a notebook's
+    page_filenames, or would start if it were added to the notebook"""
+    key = _natural_sort_key(Path(filename).stem)
+    return 1 + sum(1 for n in page_names if _natural_sort_key(Path(n).stem) < key)
+
+
+def folder_pages(folder: Path, pages=None):
+    """Pages of a single notebook folder, optionally restricted to a
+    collection of page numbers"""
+    sorted_images, sorted_pdfs = folder_files(folder)
+
+    if len(sorted_pdfs) > 0:
+        for pg, pdf_im, pdf_file in _notebook_images(folder, sorted_pdfs, pages):
+            d = _input_image(io.BytesIO(pdf_im.data), pg, pdf_file.name, folder.name)
+            # drop the embedded image before extracting the next one
+            del pdf_im
+            yield d
+
+    for i, img_path in enumerate(sorted_images):
+        if pages is not None and (i + 1) not in pages:
+            continue
+        yield _input_image(img_path, i + 1, img_path.name, folder.name)
+
+
+def notebook_folders(data_dir: Path) -> list[Path]:
+    """Naturally sorted notebook folders of a data directory"""
+    folders = list(Path(data_dir).glob("*/"))
+    return sorted(folders, key=lambda x: _natural_sort_key(x.stem))
+
+
+def all_files(data_dir: Path, pages=None):
     """Find all pdf and image files across the whole collection, with natural
-    sorting"
+    sorting. If pages is given, only those page numbers of each folder are
+    yielded.
     """
-    folders = list(Path(data_dir).glob("*/"))
-    sorted_folders = sorted(folders, key=lambda x: _natural_sort_key(x.stem))
+    for f in notebook_folders(data_dir):
+        yield from folder_pages(f, pages)
 
-    image_patterns = ["*.jpg", "*.JPG", "*.jpeg", "*.JPEG"]
-    pdf_patterns = ["*.pdf", "*.PDF"]
-    for f in sorted_folders:
-        images = []
-        pdfs = []
-        for p in image_patterns:
-            images.extend(Path(data_dir / f).glob(p))
-        for p in pdf_patterns:
-            pdfs.extend(Path(data_dir / f).glob(p))
-        sorted_images = sorted(images, key=lambda x: _natural_sort_key(x.stem))
-        sorted_pdfs = sorted(pdfs, key=lambda x: _natural_sort_key(x.stem))
-        assert len(sorted_images) == 0 or len(sorted_pdfs) == 0
-
-        for pg, pdf_im, pdf_file in _notebook_images(sorted_pdfs):
-            raw_img = Image.open(io.BytesIO(pdf_im.data))
-            img = _process_image(raw_img)
-            blob = _image_to_blob(img)
-            d = BaroqueInputImage(
-                page=pg,
-                filename=pdf_file.name,
-                folder=f.name,
-                image=blob,
-                width=img.width,
-                height=img.height,
-                original_width=raw_img.width,
-                original_height=raw_img.height,
-            )
-            yield d
 
-        for i, img_path in enumerate(sorted_images):
-            raw_img = Image.open(img_path)
-            img = _process_image(raw_img)
-            blob = _image_to_blob(img)
-            d = BaroqueInputImage(
-                page=(i + 1),
-                filename=img_path.name,
-                folder=f.name,
-                image=blob,
-                width=img.width,
-                height=img.height,
-                original_width=raw_img.width,
-                original_height=raw_img.height,
-            )
-            yield d
+def _input_image(source, page: int, filename: str, folder: str):
+    """Decode, downscale and encode a single page image"""
+    key = f"{folder}|{filename}|{page}"
+    with profiling.span("decode_resize", key), Image.open(source) as raw_img:
+        original_width, original_height = raw_img.width, raw_img.height
+        raw_img.draft("L", _target_size(original_width, original_height))
+        img = _process_image(raw_img)
+    with profiling.span("jpeg_encode", key) as sp:
+        blob = _image_to_blob(img)
+        sp.nbytes = len(blob)
+    return BaroqueInputImage(
+        page=page,
+        filename=filename,
+        folder=folder,
+        image=blob,
+        width=img.width,
+        height=img.height,
+        original_width=original_width,
+        original_height=original_height,
+    )
 
 
 def _natural_sort_key(s: str) -> list:
@@ -108,12 +244,15 @@ def _natural_sort_key(s: str) -> list:
     return [convert(c) for c in re.split("([0-9]+)", s)]
 
 
+def _target_size(width: int, height: int) -> tuple[int, int]:
+    scale = min(1.0, cfg.longside_res / max(width, height))
+    return (int(width * scale), int(height * scale))
+
+
 def _process_image(img):
     # Apply scaling if needed
-    max_dim = max(img.width, img.height)
-    scale = cfg.longside_res / max_dim
-    if scale < 1.0:
-        new_size = (int(img.width * scale), int(img.height * scale))
+    new_size = _target_size(img.width, img.height)
+    if new_size != img.size:
         scaled_img = img.resize(new_size, Image.Resampling.LANCZOS)
     else:
         scaled_img = img
@@ -122,6 +261,17 @@ def _process_image(img):
     return result
 
 
+def rescale_blob(blob: bytes, longside: int) -> tuple[bytes, int, int]:
+    """Downscale an encoded page image so its long side is at most longside"""
+    with Image.open(io.BytesIO(blob)) as img:
+        if max(img.width, img.height) <= longside:
+            return blob, img.width, img.height
+        scale = longside / max(img.width, img.height)
+        new_size = (int(img.width * scale), int(img.height * scale))
+        scaled_img = img.resize(new_size, Image.Resampling.LANCZOS)
+    return _image_to_blob(scaled_img), scaled_img.width, scaled_img.height
+
+
 def _image_to_blob(pil_image: Image.Image, quality: int = 95) -> bytes:
     """Convert PIL Image to JPEG bytes for database storage"""
     buffer = io.BytesIO()
@@ -1,3 +1,8 @@
+import io
+from pathlib import Path
+
+from PIL import Image
+
 import config as cfg
 
 
@@ -33,3 +38,55 @@ def save_page_image(
 def _blob_to_image(blob_data: bytes) -> Image.Image:
     """Convert database BLOB back to PIL Image"""
     return Image.open(io.BytesIO(blob_data))
+
+
+def _is_current(dest: Path, source_mtime: int) -> bool:
+    return dest.exists() and dest.stat().st_mtime_ns >= source_mtime
+
+
+def thumbnails_current(dests: list[Path], source_mtime: int) -> bool:
+    """Whether every output is at least as new as the source image"""
+    return all(_is_current(d, source_mtime) for d in dests)
+
+
+def make_thumbnails(src, dests: dict, rotate: bool = False, original: Path = None):
+    """
+    Decode a page image once, optionally rotate it a quarter turn clockwise,
+    and write a JPEG thumbnail to dests[width] for each display width. With
+    original, the full-size (rotated) image is written there too. src is a
+    path or encoded bytes.
+    """
+    src_bytes = src.read_bytes() if isinstance(src, Path) else src
+
+    with Image.open(io.BytesIO(src_bytes)) as img:
+        if original is None:
+            # only decode as many pixels as the largest thumbnail needs
+            display_width = img.height if rotate else img.width
+            scale = max(dests) / display_width
+            if scale < 1.0:
+                img.draft(img.mode, (int(img.width * scale), int(img.height * scale)))
+        elif not rotate:
+            # the original needs no re-encoding
+            with open(original, "wb") as f:
+                f.write(src_bytes)
+
+        img.load()
+        if rotate:
+            img = img.transpose(Image.Transpose.ROTATE_270)
+            if original is not None:
+                img.save(original, "JPEG", quality=95)
+
+        # each size is resized from the one above it
+        for width in sorted(dests, reverse=True):
+            if img.width > width:
+                height = round(img.height * width / img.width)
+                img = img.resize((width, height), Image.Resampling.BILINEAR)
+            buffer = io.BytesIO()
+            img.save(buffer, "JPEG", quality=cfg.VAULT_THUMBNAIL_QUALITY, optimize=True)
+            thumbnail = buffer.getvalue()
+            # noisy scans barely larger than the thumbnail can grow when
+            # re-encoded, so keep the source when that happens
+            if not rotate and len(thumbnail) >= len(src_bytes):
+                thumbnail = src_bytes
+            with open(dests[width], "wb") as f:
+                f.write(thumbnail)
@@ -1,31 +1,31 @@
+# Heavy dependencies (anthropic, PIL and pypdf through dataimport, process
+# and routing) are imported inside the commands that use them, so --help and
+# short commands start fast. bench_startup.py guards this.
+
 # import fnmatch
-import io
+import json
 import os
-import shelve
-import shutil
 import signal
-from logging import shutdown
+import threading
+import time
+from datetime import datetime
 
 # import sys
 from pathlib import Path
-from pydoc import plain
-from unittest import skip
 from urllib.parse import quote
 
 import click
-from anthropic import Anthropic
-from PIL import Image
 
-from base import BaroquePage
-from dataimport import all_files, import_raw_files
-from process import extract_text, format_text, translate_text
+import config as cfg
+import profiling
+from archive import PackedArchive, pack_archive
+from workqueue import WorkQueue
 
 # from database import BaroqueDB, populate_database_from_files
 # from latex import create_latex_document
 # from pdf import find_all_files, find_pdf_files, notebook_images
 # from pypdf import PdfReader
 
-# import config as cfg
 # from image import blob_to_image, save_page_image
 # from old.process import analyse_text, extract_text, format_text, translate_text
 
@@ -44,27 +44,229 @@ def main():
     pass
 
 
+def _client():
+    from anthropic import Anthropic
+
+    return Anthropic(api_key=os.getenv("ANTHROPIC_API_KEY"))
+
+
 def _compute_or_cache(input_page, client, db):
+    from base import BaroquePage
+    from process import extract_text_adaptive, translate_text_routed
+
     key = f"{input_page.folder}|{input_page.filename}|{input_page.page}"
     if key in db:
         page = db[key]
         print(f"Retrieving {key} from cache...")
     else:
         print(f"Processing {key}...")
-        french_text, _ocr_log = extract_text(client, input_page.image)
-        english_text, _translate_log = translate_text(client, french_text)
+        french_text, _ocr_log, ocr_model, ocr_res, ocr_truncated = (
+            extract_text_adaptive(client, input_page.image)
+        )
+        english_text, _translate_log, translation_model, translation_truncated = (
+            translate_text_routed(client, french_text)
+        )
         # french_tex, _french_format_log = format_text(client, french_text)
         # english_tex, _english_format_log = format_text(client, english_text)
         english_tex = ""
         french_tex = ""
         page = BaroquePage(
-            input_page, english_text, french_text, english_tex, french_tex
+            input_page,
+            english_text,
+            french_text,
+            english_tex,
+            french_tex,
+            ocr_res,
+            ocr_model,
+            translation_model,
+            ocr_truncated or translation_truncated,
         )
     return page
 
 
+def _parse_page_range(_ctx, _param, value):
+    """Parse a page selection like '850-900' or '12' into a range"""
+    if value is None:
+        return None
+    try:
+        start, _, end = value.partition("-")
+        start, end = int(start), int(end or start)
+    except ValueError:
+        raise click.BadParameter("expected a page or page range like 850-900")
+    if end < start:
+        raise click.BadParameter(f"range {value} ends before it starts")
+    return range(start, end + 1)
+
+
+def profile_options(command):
+    """Add the --profile and --trace options to a command"""
+    command = click.option(
+        "--trace",
+        type=click.Path(path_type=Path),
+        help="With --profile, also write a Chrome trace JSON timeline here",
+    )(command)
+    return click.option(
+        "--profile", is_flag=True, help="Report time spent in each stage"
+    )(command)
+
+
+def _start_profiling(profile: bool):
+    if profile:
+        profiling.enable()
+
+
+def _finish_profiling(profile: bool, trace: Path):
+    if profile:
+        print(profiling.report())
+        if trace is not None:
+            profiling.write_trace(trace)
+            print(f"Written {trace}")
+
+
+def _parse_folder_values(convert):
+    """Callback parsing repeated FOLDER=VALUE options into a dict"""
+
+    def callback(_ctx, _param, values):
+        result = {}
+        for value in values:
+            folder, sep, v = value.rpartition("=")
+            try:
+                result[folder] = convert(v)
+            except ValueError:
+                sep = ""
+            if not sep:
+                raise click.BadParameter(f"expected FOLDER=VALUE, got {value}")
+        return result
+
+    return callback
+
+
 @main.command()
-def process():
+@click.option(
+    "--pages",
+    callback=_parse_page_range,
+    help="Only process this page range of each folder, e.g. 850-900",
+)
+@click.option(
+    "--workers",
+    default=1,
+    help="Maximum number of pages in flight, shared fairly across folders",
+)
+@click.option(
+    "--priority",
+    multiple=True,
+    callback=_parse_folder_values(int),
+    help="Folder priority like 'SP 84_579=10'; higher gets a bigger share",
+)
+@click.option(
+    "--deadline",
+    multiple=True,
+    callback=_parse_folder_values(datetime.fromisoformat),
+    help="Folder deadline like 'SP 84_579=2026-10-20T17:00'; earliest goes first",
+)
+@click.option(
+    "--shortest-first",
+    is_flag=True,
+    help="Prefer folders with the fewest remaining pages",
+)
+@profile_options
+def process(pages, workers, priority, deadline, shortest_first, profile, trace):
+    _start_profiling(profile)
+    try:
+        if workers > 1 or priority or deadline or shortest_first:
+            _process_scheduled(pages, workers, priority, deadline, shortest_first)
+        else:
+            _process_all(pages)
+    finally:
+        _finish_profiling(profile, trace)
+
+
+def _process_scheduled(pages, workers, priority, deadline, shortest_first):
+    """Process the missing pages of every folder in the order chosen by a
+    FolderScheduler, printing estimated completion times as it goes"""
+    from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+    import shelve
+
+    from dataimport import notebook_folders, page_filenames
+    from scheduler import FolderJob, FolderScheduler
+
+    signal.signal(signal.SIGINT, signal_handler)
+    input_dir = Path.cwd() / "input_data"
+    output_dir = Path.cwd() / "raw-output"
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    jobs = []
+    for folder in notebook_folders(input_dir):
+        n_pages = len(page_filenames(folder))
+        todo = [
+            p
+            for p in range(1, n_pages + 1)
+            if (pages is None or p in pages)
+            and not _outputs_exist(output_dir, folder.name, p)
+        ]
+        jobs.append(
+            FolderJob(
+                folder.name,
+                todo,
+                priority.get(folder.name, 0),
+                deadline.get(folder.name),
+            )
+        )
+    for name in set(priority) | set(deadline):
+        if not (input_dir / name).is_dir():
+            print(f"Warning: no folder {name} in {input_dir}")
+    scheduler = FolderScheduler(jobs, shortest_first)
+
+    client = _client()
+    futures = {}
+    completed = 0
+    last_status = 0
+    started = time.monotonic()
+    db_path = Path.cwd() / "baroque"
+    with shelve.open(db_path) as db, ThreadPoolExecutor(workers) as pool:
+        cache = _SharedCache(db)
+        while running or futures:
+            while running and len(futures) < workers:
+                item = scheduler.next()
+                if item is None:
+                    break
+                folder, page = item
+                future = pool.submit(
+                    _process_queued,
+                    input_dir / folder,
+                    page,
+                    client,
+                    output_dir,
+                    False,
+                    cache,
+                )
+                futures[future] = item
+
+            if not futures:
+                break
+
+            done, _ = wait(futures, return_when=FIRST_COMPLETED)
+            for future in done:
+                folder, page = futures.pop(future)
+                if future.exception() is not None:
+                    print(f"Warning: {folder} page {page} failed: {future.exception()}")
+                scheduler.finished(folder)
+                completed += 1
+
+            # pages finish in batches, so completed can step past a multiple
+            if completed - last_status >= 10:
+                last_status = completed
+                seconds_per_page = (time.monotonic() - started) * workers / completed
+                print(scheduler.status(seconds_per_page, workers))
+    _report_translation_memory()
+
+
+def _process_all(pages):
+    import shelve
+
+    from dataimport import all_files
+
     signal.signal(signal.SIGINT, signal_handler)
     input_dir = Path.cwd() / "input_data"
     output_dir = Path.cwd() / "raw-output"
@@ -72,46 +274,360 @@ def process():
 
     override = False
 
-    client = Anthropic(api_key=os.getenv("ANTHROPIC_API_KEY"))
+    client = _client()
     db_path = Path.cwd() / "baroque"
     with shelve.open(db_path) as db:
-        for input_page in all_files(input_dir):
-            text_folder = output_dir / input_page.folder
-            english_path = text_folder / f"english_page_{input_page.page:03d}.txt"
-            french_path = text_folder / f"french_page_{input_page.page:03d}.txt"
-            image_folder = text_folder / "images"
-            image_path = image_folder / f"page_{input_page.page:03d}.jpg"
-
-            if not os.path.isdir(text_folder):
-                text_folder.mkdir(parents=True, exist_ok=False)
-            if not os.path.isdir(image_folder):
-                image_folder.mkdir(parents=True, exist_ok=False)
-
-            # does the output already exist in filesystem?
-            exists = (
-                french_path.exists() and english_path.exists() and image_path.exists()
+        for input_page in all_files(input_dir, pages):
+            _process_page(input_page, client, db, output_dir, override)
+    _report_translation_memory()
+
+
+def _report_translation_memory():
+    from translation_memory import default_translation_memory
+
+    print(default_translation_memory().report())
+
+
+def _output_paths(output_dir: Path, folder: str, page: int):
+    """French, English and image output paths of a page"""
+    text_folder = output_dir / folder
+    french_path = text_folder / f"french_page_{page:03d}.txt"
+    english_path = text_folder / f"english_page_{page:03d}.txt"
+    image_path = text_folder / "images" / f"page_{page:03d}.jpg"
+    return french_path, english_path, image_path
+
+
+def _outputs_exist(output_dir: Path, folder: str, page: int) -> bool:
+    return all(p.exists() for p in _output_paths(output_dir, folder, page))
+
+
+def _process_page(input_page, client, db, output_dir: Path, override: bool):
+    """OCR and translate a single page, writing its text and image outputs"""
+    text_folder = output_dir / input_page.folder
+    french_path, english_path, image_path = _output_paths(
+        output_dir, input_page.folder, input_page.page
+    )
+    key = f"{input_page.folder}|{input_page.filename}|{input_page.page}"
+
+    image_path.parent.mkdir(parents=True, exist_ok=True)
+
+    # does the output already exist in filesystem?
+    if _outputs_exist(output_dir, input_page.folder, input_page.page) and not override:
+        print(f"skipping {key} as present in filesystem...")
+        return
+
+    with profiling.span("compute", key):
+        page = _compute_or_cache(input_page, client, db)
+
+    with profiling.span("write", key) as sp:
+        # write french
+        with open(french_path, "w", encoding="utf-8") as f:
+            f.write(page.french_text)
+            print(f"Written {french_path}")
+
+        # write english
+        with open(english_path, "w", encoding="utf-8") as f:
+            f.write(page.english_text)
+            print(f"Written {english_path}")
+
+        # write the already encoded image
+        with open(image_path, "wb") as f:
+            f.write(page.input_image.image)
+            print(f"Written {image_path}")
+        sp.nbytes = len(page.input_image.image)
+
+    # record the routing decisions for tuning throughput and cost
+    _record_routing(
+        text_folder / "routing.tsv",
+        f"{input_page.page}\t{page.ocr_model}\t{page.ocr_resolution}"
+        f"\t{page.translation_model}\t{int(page.truncated)}\n",
+    )
+
+
+def _record_routing(routing_path: Path, row: str):
+    """
+    Append a page's row to routing.tsv. Workers in other processes or on
+    other machines record pages of the same folder, so each row is a single
+    O_APPEND write rather than a rewrite of the file. Re-runs append a new
+    row for the page; read_routing keeps the last one.
+    """
+    fd = os.open(routing_path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+    try:
+        os.write(fd, row.encode("utf-8"))
+    finally:
+        os.close(fd)
+
+
+def _enqueue_changes(
+    input_dir: Path, output_dir: Path, manifest: dict, queue: WorkQueue
+) -> dict:
+    """
+    Queue the pages of new or changed scans and return the updated manifest.
+    Folders with a scan modified in the last WATCH_SETTLE_SECONDS are left
+    for a later poll, as they are probably still being copied in.
+
+    Page numbers come from the sorted scans of a folder, so a scan added or
+    removed anywhere but the end, or a pdf that changed, can move every later
+    page. All pages from the first such scan on are then queued to override
+    their existing outputs. Otherwise pages whose outputs exist are not
+    queued, so the first watch over a processed corpus queues nothing.
+    """
+    from dataimport import first_page_of, page_filenames, scan_inputs
+
+    current = scan_inputs(input_dir)
+    settle_ns = time.time_ns() - cfg.WATCH_SETTLE_SECONDS * 1_000_000_000
+    changed = {}
+    removed = {}
+    unsettled = set()
+    for key, sig in current.items():
+        folder, filename = key.split("/", 1)
+        if sig[1] > settle_ns:
+            unsettled.add(folder)
+        elif manifest.get(key) != sig:
+            changed.setdefault(folder, set()).add(filename)
+    for key in manifest:
+        if key not in current:
+            folder, filename = key.split("/", 1)
+            removed.setdefault(folder, set()).add(filename)
+
+    new_manifest = dict(manifest)
+    for folder in (changed.keys() | removed.keys()) - unsettled:
+        page_names = page_filenames(input_dir / folder)
+        filenames = changed.get(folder, set())
+        movers = removed.get(folder, set()) | {
+            f
+            for f in filenames
+            if f"{folder}/{f}" not in manifest or f.lower().endswith(".pdf")
+        }
+        start = min(
+            (first_page_of(page_names, f) for f in movers),
+            default=len(page_names) + 1,
+        )
+        # pages from start on moved if any of them come from a known scan,
+        # otherwise they are just new pages appended to the folder
+        moved = any(f"{folder}/{n}" in manifest for n in page_names[start - 1 :])
+        later = [
+            p
+            for p in range(start, len(page_names) + 1)
+            if moved or not _outputs_exist(output_dir, folder, p)
+        ]
+        queue.enqueue(folder, later, override=moved)
+        # changed scans override existing outputs
+        queue.enqueue(
+            folder,
+            [i + 1 for i, n in enumerate(page_names[: start - 1]) if n in filenames],
+            override=True,
+        )
+
+        for filename in removed.get(folder, set()):
+            del new_manifest[f"{folder}/{filename}"]
+        for filename in filenames:
+            new_manifest[f"{folder}/{filename}"] = current[f"{folder}/{filename}"]
+        print(
+            f"Queued {len(filenames)} new or changed scans from {folder}"
+            + (f", pages from {start} on have moved" if moved else "")
+        )
+        if folder in removed:
+            print(
+                f"Warning: {len(removed[folder])} scans removed from {folder}, "
+                f"outputs after page {len(page_names)} are stale"
             )
-            if exists and not override:
-                key = f"{input_page.folder}|{input_page.filename}|{input_page.page}"
-                print(f"skipping {key} as present in filesystem...")
+    return new_manifest
+
+
+class _SharedCache:
+    """
+    Read-only view of the baroque shelve that worker threads can share. The
+    shelve isn't thread safe, so every read takes a lock.
+    """
+
+    def __init__(self, db):
+        self.db = db
+        self.lock = threading.Lock()
+
+    def __contains__(self, key):
+        with self.lock:
+            return key in self.db
+
+    def __getitem__(self, key):
+        with self.lock:
+            return self.db[key]
+
+
+def _process_queued(
+    folder_path: Path, page: int, client, output_dir, override, cache=None
+):
+    # queue workers may share the working directory with other processes,
+    # which an open shelve would lock, so they go to the API without a cache
+    from dataimport import folder_pages
+
+    # check before folder_pages decodes and re-encodes the page
+    if not override and _outputs_exist(output_dir, folder_path.name, page):
+        print(f"skipping {folder_path.name} page {page} as present in filesystem...")
+        return
+
+    for input_page in folder_pages(folder_path, {page}):
+        _process_page(input_page, client, cache or {}, output_dir, override)
+
+
+def _serve_queue(
+    queue: WorkQueue, input_dir, output_dir, workers, poll=None, export=False
+):
+    """
+    Process leased pages from the queue with at most workers pages in flight.
+    With a poll callable (watch mode) this runs until interrupted, otherwise
+    it returns once no pages are left pending or leased by any worker.
+    """
+    from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+    from dataimport import read_raw_files
+
+    client = _client()
+    futures = {}
+    touched = set()
+    last_renew = time.monotonic()
+    with ThreadPoolExecutor(workers) as pool:
+        while running or futures:
+            if running and poll is not None:
+                poll()
+
+            # claiming takes the shared queue's write lock, so only claim
+            # when there's a free slot
+            if running and len(futures) < workers:
+                for folder, page, override in queue.claim(workers - len(futures)):
+                    future = pool.submit(
+                        _process_queued,
+                        input_dir / folder,
+                        page,
+                        client,
+                        output_dir,
+                        override,
+                    )
+                    futures[future] = (folder, page)
+
+            if not futures:
+                if poll is None and queue.outstanding() == 0:
+                    break
+                # idle, or waiting on pages leased by other workers
+                time.sleep(5)
                 continue
 
-            page = _compute_or_cache(input_page, client, db)
+            if time.monotonic() - last_renew > queue.lease_seconds / 2:
+                queue.renew(list(futures.values()))
+                last_renew = time.monotonic()
 
-            # write french
-            with open(french_path, "w", encoding="utf-8") as f:
-                f.write(page.french_text)
-                print(f"Written {french_path}")
+            done, _ = wait(futures, timeout=1, return_when=FIRST_COMPLETED)
+            for future in done:
+                folder, page = futures.pop(future)
+                if future.exception() is not None:
+                    print(f"Warning: {folder} page {page} failed: {future.exception()}")
+                queue.finish(folder, page, ok=future.exception() is None)
+                touched.add(folder)
 
-            # write english
-            with open(english_path, "w", encoding="utf-8") as f:
-                f.write(page.english_text)
-                print(f"Written {english_path}")
+            if export:
+                ready = {f for f in touched if queue.outstanding(f) == 0}
+                if ready:
+                    export_obsidian(
+                        read_raw_files(output_dir, ready), Path.cwd() / "baroque-vault"
+                    )
+                    touched -= ready
+    _report_translation_memory()
 
-            # write image
-            img = Image.open(io.BytesIO(page.input_image.image))
-            img.save(image_path)
-            print(f"Written {image_path}")
+
+@main.command()
+@click.option("--interval", default=60, help="Seconds between scans of input_data")
+@click.option("--workers", default=4, help="Maximum number of pages in flight")
+@click.option(
+    "--obsidian",
+    "export",
+    is_flag=True,
+    help="Export folders to the obsidian vault once their queued pages are done",
+)
+def watch(interval, workers, export):
+    """Continuously process new scans as they land in input_data."""
+    signal.signal(signal.SIGINT, signal_handler)
+    input_dir = Path.cwd() / "input_data"
+    output_dir = Path.cwd() / "raw-output"
+    manifest_path = Path.cwd() / "watch-manifest.json"
+    queue_path = Path.cwd() / "watch-queue.sqlite"
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    manifest = {}
+    if manifest_path.exists():
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+    next_scan = 0.0
+
+    with WorkQueue(queue_path) as queue:
+
+        def poll():
+            nonlocal manifest, next_scan
+            if time.monotonic() < next_scan:
+                return
+            manifest = _enqueue_changes(input_dir, output_dir, manifest, queue)
+            with open(manifest_path, "w", encoding="utf-8") as f:
+                json.dump(manifest, f)
+            next_scan = time.monotonic() + interval
+
+        _serve_queue(queue, input_dir, output_dir, workers, poll, export)
+
+
+@main.command()
+@click.option(
+    "--queue",
+    "queue_path",
+    type=click.Path(path_type=Path),
+    default=Path("work-queue.sqlite"),
+    help="Shared SQLite queue file",
+)
+@click.option(
+    "--pages",
+    callback=_parse_page_range,
+    help="Only queue this page range of each folder, e.g. 850-900",
+)
+@click.option(
+    "--override", is_flag=True, help="Reprocess pages even if their outputs exist"
+)
+def enqueue(queue_path, pages, override):
+    """Queue every page of input_data for distributed processing. Pages whose
+    outputs exist are left out unless --override is set."""
+    from dataimport import notebook_folders, page_filenames
+
+    input_dir = Path.cwd() / "input_data"
+    output_dir = Path.cwd() / "raw-output"
+    with WorkQueue(queue_path) as queue:
+        for folder in notebook_folders(input_dir):
+            n_pages = len(page_filenames(folder))
+            selected = [
+                p
+                for p in range(1, n_pages + 1)
+                if (pages is None or p in pages)
+                and (override or not _outputs_exist(output_dir, folder.name, p))
+            ]
+            queue.enqueue(folder.name, selected, override)
+            print(f"Queued {len(selected)} pages from {folder.name}")
+
+
+@main.command()
+@click.option(
+    "--queue",
+    "queue_path",
+    type=click.Path(path_type=Path),
+    default=Path("work-queue.sqlite"),
+    help="Shared SQLite queue file",
+)
+@click.option("--workers", default=4, help="Maximum number of pages in flight")
+@click.option("--lease", default=600, help="Seconds a claimed page is leased for")
+@click.option("--worker-id", help="Name of this worker, defaults to host-pid")
+def work(queue_path, workers, lease, worker_id):
+    """Process pages from a shared queue until it is empty."""
+    signal.signal(signal.SIGINT, signal_handler)
+    input_dir = Path.cwd() / "input_data"
+    output_dir = Path.cwd() / "raw-output"
+    output_dir.mkdir(parents=True, exist_ok=True)
+    with WorkQueue(queue_path, worker_id, lease) as queue:
+        print(f"Worker {queue.worker} starting...")
+        _serve_queue(queue, input_dir, output_dir, workers)
 
 
 def folder_code(s):
@@ -157,21 +673,6 @@ def filter_txt(s):
     return result
 
 
-from pathlib import Path
-from typing import List, Union
-
-from PIL import Image
-
-
-def rotate_image(in_path, out_path, rotation_angle=90):
-    # Load the image
-    img = Image.open(in_path)
-    # Rotate (PIL rotates counter-clockwise, use negative for clockwise)
-    rotated = img.rotate(-rotation_angle, expand=True)
-    # Save back to the same path
-    rotated.save(out_path)
-
-
 ROTATE_LEFT_LIST = [
     "ADM_1_3935_1749",
     "ADM_1_3940_1754",
@@ -189,59 +690,191 @@ ROTATE_RIGHT_LIST = []
 
 
 @main.command()
-def obsidian():
-
-    input_dir = Path.cwd() / "raw-output"
+@click.option(
+    "--archive",
+    "archive_path",
+    type=click.Path(exists=True, path_type=Path),
+    help="Read pages from a packed archive instead of raw-output",
+)
+@click.option(
+    "--originals", is_flag=True, help="Also copy full-size page images to the vault"
+)
+@click.option("--jobs", type=int, help="Image processes, defaults to the CPU count")
+@profile_options
+def obsidian(archive_path, originals, jobs, profile, trace):
+    from dataimport import read_raw_files
+
+    _start_profiling(profile)
     output_dir = Path.cwd() / "baroque-vault"
+    try:
+        if archive_path is None:
+            raw_data = read_raw_files(Path.cwd() / "raw-output")
+            export_obsidian(raw_data, output_dir, originals, jobs=jobs)
+        else:
+            with PackedArchive(archive_path) as archive:
+                export_obsidian(
+                    archive.raw_files(),
+                    output_dir,
+                    originals,
+                    archive_path.stat().st_mtime_ns,
+                    jobs,
+                )
+    finally:
+        _finish_profiling(profile, trace)
+
+
+def _thumbnail_for(thumb_dests: dict, embed_width: int) -> Path:
+    """Smallest thumbnail at least as wide as the embed, else the largest"""
+    wide_enough = [w for w in thumb_dests if w >= embed_width]
+    return thumb_dests[min(wide_enough) if wide_enough else max(thumb_dests)]
+
+
+def export_obsidian(
+    raw_data: dict,
+    output_dir: Path,
+    originals: bool = False,
+    source_mtime: int = 0,
+    jobs: int = None,
+):
+    """
+    Write the obsidian vault notes and images for read_raw_files style input.
+    Page images are written as display-size thumbnails by a process pool,
+    skipping pages whose thumbnails are newer than the source image (or
+    than source_mtime for in-memory images). With originals, full-size
+    images are also written and linked from the reference notes. Full-size
+    images left in images/ by earlier versions are removed, as no note
+    links to them any more.
+    """
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor
+
+    from image import make_thumbnails, thumbnails_current
+
     output_image_dir = output_dir / "images"
+    output_original_dir = output_image_dir / "originals"
     output_reference_dir = output_dir / "reference"
     output_dir.mkdir(parents=True, exist_ok=True)
     output_image_dir.mkdir(parents=True, exist_ok=True)
     output_reference_dir.mkdir(parents=True, exist_ok=True)
+    if originals:
+        output_original_dir.mkdir(parents=True, exist_ok=True)
+
+    futures = []
+    removed = 0
+    # watch exports while its threads have pages in flight, and forking a
+    # threaded process can deadlock, so the workers are spawned
+    mp_context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(jobs, mp_context=mp_context) as pool:
+        for folder, files in raw_data.items():
+            code = folder_code(folder)
+            print(code)
+            pages = []
+            text_dest = output_dir / f"{code}.md"
+
+            for i, (fren_txt, eng_txt, im_name, im) in enumerate(files):
+                stem = f"{code}--{Path(im_name).stem}"
+                thumb_dests = {
+                    w: output_image_dir / f"{stem}-{w}.jpg"
+                    for w in cfg.VAULT_THUMBNAIL_WIDTHS
+                }
+                original_dest = (
+                    output_original_dir / f"{stem}.jpg" if originals else None
+                )
+                ref_dest = output_reference_dir / f"{code}--{(i+1):03d}.md"
+
+                # the full-size image earlier versions wrote to images/
+                legacy_dest = output_image_dir / f"{stem}.jpg"
+                if legacy_dest.exists():
+                    legacy_dest.unlink()
+                    removed += 1
+
+                # thumbnails are made in the pool and timed by
+                # vault_thumbnails_wait, this only checks and submits them
+                with profiling.span("vault_image_submit", f"{folder}|{im_name}"):
+                    mtime = (
+                        im.stat().st_mtime_ns if isinstance(im, Path) else source_mtime
+                    )
+                    dests = list(thumb_dests.values())
+                    if original_dest is not None:
+                        dests.append(original_dest)
+                    if not thumbnails_current(dests, mtime):
+                        rotate = any(s in stem for s in ROTATE_LEFT_LIST)
+                        src = im if isinstance(im, Path) else bytes(im)
+                        futures.append(
+                            pool.submit(
+                                make_thumbnails, src, thumb_dests, rotate, original_dest
+                            )
+                        )
+
+                original_link = ""
+                if originals:
+                    original_link = (
+                        f"\n\n[[images/originals/{original_dest.name}|Full size]]"
+                    )
+
+                # ref_string = f"![[images/{im_dest.name}|800]]\n\n```\n{fren_txt}\n```\n---\n```\n{eng_txt}\n```"
+
+                ref_string = f"Scan | Transcription | Translation\n -- | -- | --\n ![[images/{_thumbnail_for(thumb_dests, 500).name}|500]] |```\n{fren_txt}\n``` | ```\n{eng_txt}\n```{original_link}"
+
+                with profiling.span("vault_notes", f"{folder}|{im_name}"):
+                    with open(ref_dest, "w", encoding="utf-8") as f:
+                        f.write(ref_string)
+
+                filtered_eng_txt = filter_txt(eng_txt)
+                ref_url = quote(f"reference/{ref_dest.name}")
+
+                title_string = f"## Page {(i+1)}\n"
+                image_string = f"![[images/{_thumbnail_for(thumb_dests, 400).name}|400]]\n[Reference]({ref_url})\n"
+
+                out_string = f"{title_string}{image_string}\n{filtered_eng_txt}"
+                pages.append(out_string)
+
+            out_string = "\n\n---\n\n".join(pages)
+            with profiling.span("vault_notes", folder):
+                with open(text_dest, "w", encoding="utf-8") as f:
+                    f.write(out_string)
+
+        with profiling.span("vault_thumbnails_wait"):
+            for future in futures:
+                future.result()
+    print(f"Written {len(futures)} page thumbnails")
+    if removed:
+        print(f"Removed {removed} unlinked full-size images")
+
+
+@main.command("build-tm")
+def build_tm():
+    """Build the translation memory from raw-output."""
+    from dataimport import read_raw_files
+    from translation_memory import (
+        TM_PATH,
+        build_translation_memory,
+        save_translation_memory,
+    )
+
+    memory = build_translation_memory(read_raw_files(Path.cwd() / "raw-output"))
+    save_translation_memory(memory, TM_PATH)
+    print(f"Written {len(memory)} segments to {TM_PATH}")
 
-    # read in all input
-    raw_data = import_raw_files(input_dir)
-    for folder, files in raw_data.items():
-        code = folder_code(folder)
-        print(code)
-        pages = []
-        text_dest = output_dir / f"{code}.md"
-
-        for i, (fren, eng, im) in enumerate(files):
-            im_dest = output_image_dir / f"{code}--{im.name}"
-            ref_dest = output_reference_dir / f"{code}--{(i+1):03d}.md"
-
-            if any(s in im_dest.name for s in ROTATE_LEFT_LIST):
-                print(f"rotating {im_dest}")
-                rotate_image(im, im_dest)
-            else:
-                # just copy the image itself
-                shutil.copyfile(im, im_dest)
-
-            with open(eng, "r", encoding="utf-8") as f:
-                eng_txt = f.read()
-            with open(fren, "r", encoding="utf-8") as f:
-                fren_txt = f.read()
 
-            # ref_string = f"![[images/{im_dest.name}|800]]\n\n```\n{fren_txt}\n```\n---\n```\n{eng_txt}\n```"
-
-            ref_string = f"Scan | Transcription | Translation\n -- | -- | --\n ![[images/{im_dest.name}|500]] |```\n{fren_txt}\n``` | ```\n{eng_txt}\n```"
-
-            with open(ref_dest, "w", encoding="utf-8") as f:
-                f.write(ref_string)
-
-            filtered_eng_txt = filter_txt(eng_txt)
-            ref_url = quote(f"reference/{ref_dest.name}")
+@main.command()
+@click.argument("archive_path", type=click.Path(path_type=Path))
+def pack(archive_path):
+    """Pack raw-output into a single archive file."""
+    from dataimport import import_raw_files
 
-            title_string = f"## Page {(i+1)}\n"
-            image_string = f"![[images/{im_dest.name}|400]]\n[Reference]({ref_url})\n"
+    raw_data = import_raw_files(Path.cwd() / "raw-output")
+    pack_archive(raw_data, archive_path)
+    print(f"Packed {len(raw_data)} folders into {archive_path}")
 
-            out_string = f"{title_string}{image_string}\n{filtered_eng_txt}"
-            pages.append(out_string)
 
-        out_string = "\n\n---\n\n".join(pages)
-        with open(text_dest, "w", encoding="utf-8") as f:
-            f.write(out_string)
+@main.command()
+@click.argument("archive_path", type=click.Path(exists=True, path_type=Path))
+def unpack(archive_path):
+    """Unpack an archive file into raw-output."""
+    with PackedArchive(archive_path) as archive:
+        archive.unpack(Path.cwd() / "raw-output")
+        print(f"Unpacked {len(archive.folders)} folders from {archive_path}")
 
 
 # @main.command()
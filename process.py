@@ -1,9 +1,26 @@
 import base64
 import json
 import os
+import re
 from time import sleep
 
 import config as cfg
+import profiling
+from dataimport import rescale_blob
+from routing import (
+    ocr_budget,
+    ocr_plan,
+    page_features,
+    translation_budget,
+    translation_plan,
+)
+from translation_memory import default_translation_memory
+
+# refusals open the output, the same phrases later on are usually letter prose
+# like "I cannot assure you"
+REFUSAL_PATTERN = re.compile(
+    r"\s*(I cannot|I can't|I'm unable|I am unable|I apologi[sz]e)\b", re.IGNORECASE
+)
 
 
 def _encode_image(image_path):
@@ -35,7 +52,8 @@ def friendly_retries(func):
             except Exception as e:
                 print(f"Warning: {e}\n Retrying...")
                 last_e = e
-                sleep(10)
+                with profiling.span("retry_wait"):
+                    sleep(10)
 
         if result is not None:
             return result
@@ -45,11 +63,30 @@ def friendly_retries(func):
     return wrapper
 
 
-@friendly_retries
-def extract_text(client, image_data):
-    base64_image = base64.b64encode(image_data).decode("utf-8")
+def _create_with_budget(client, max_tokens: int, **kwargs):
+    """
+    Create a message, retrying with double the max_tokens budget (up to
+    MAX_TOKENS_CAP) only when the response was cut off. Returns the response
+    and whether it was still truncated.
+    """
+    while True:
+        with profiling.span(f"api_{kwargs['model']}"):
+            response = client.messages.create(max_tokens=max_tokens, **kwargs)
+        if response.stop_reason != "max_tokens" or max_tokens >= cfg.MAX_TOKENS_CAP:
+            break
+        max_tokens = min(2 * max_tokens, cfg.MAX_TOKENS_CAP)
+        print(f"Hit max_tokens, retrying with a budget of {max_tokens}")
+
+    truncated = response.stop_reason == "max_tokens"
+    if truncated:
+        print(f"Warning: response truncated at {max_tokens} tokens")
+    return response, truncated
 
-    max_tokens = 20000
+
+@friendly_retries
+def extract_text(
+    client, base64_image: str, model=cfg.MODEL_ID, max_tokens=cfg.MAX_TOKENS_CAP
+):
     temperature = 1
     system = "You are an advanced AI system specialized in transcribing 18th-century French handwriting from scanned images."
     messages = [
@@ -73,19 +110,23 @@ def extract_text(client, image_data):
         {"role": "assistant", "content": [{"type": "text", "text": "<thinking>"}]},
     ]
 
-    response = client.messages.create(
-        model=cfg.MODEL_ID,
-        max_tokens=max_tokens,
+    response, truncated = _create_with_budget(
+        client,
+        max_tokens,
+        model=model,
         temperature=temperature,
         system=system,
         messages=messages,
     )
 
     # retry with smaller model if refused
-    if response.stop_reason != "end_turn":
-        response = client.messages.create(
-            model=cfg.LITE_MODEL_ID,
-            max_tokens=max_tokens,
+    refused = response.stop_reason not in ("end_turn", "max_tokens")
+    if refused and model != cfg.LITE_MODEL_ID:
+        model = cfg.LITE_MODEL_ID
+        response, truncated = _create_with_budget(
+            client,
+            max_tokens,
+            model=model,
             temperature=temperature,
             system=system,
             messages=messages,
@@ -93,14 +134,91 @@ def extract_text(client, image_data):
 
     log_txt = response.content[0].text
     result = _extract_output(response.content[0].text)
-    return result, log_txt
+    return result, log_txt, model, truncated
+
+
+def ocr_is_weak(text: str, log_txt: str) -> bool:
+    """Cheap check for a transcription that deserves more pixels"""
+    if "<output>" not in log_txt or REFUSAL_PATTERN.match(text):
+        return True
+    n_words = len(text.split())
+    if n_words == 0:
+        # the prompt asks for empty tags on blank pages, so this is an answer
+        return False
+    n_illegible = len(re.findall(r"\[[^\]]*\]", text))
+    return n_illegible / n_words > cfg.OCR_MAX_ILLEGIBLE_RATIO
+
+
+def extract_text_adaptive(client, image_data):
+    """
+    OCR through the (model, resolution) plan, stopping at the first attempt
+    that gives a good transcription. Returns the text, log, the model that
+    answered, resolution used and whether the output was truncated.
+    """
+    features = page_features(image_data)
+    print(f"Page has {features.n_lines} lines, ink density {features.ink_density:.3f}")
+    max_tokens = ocr_budget(features)
+    # base64 payloads are encoded once per resolution, not once per attempt
+    payloads = {}
+    for model, res in ocr_plan():
+        if res not in payloads:
+            blob, width, height = rescale_blob(image_data, res)
+            payloads[res] = (base64.b64encode(blob).decode("utf-8"), width, height)
+        payload, width, height = payloads[res]
+        result, log_txt, model, truncated = extract_text(
+            client, payload, model, max_tokens
+        )
+        # anthropic's estimate of image tokens
+        print(f"OCR with {model} at {res}px (~{width * height // 750} image tokens)")
+        if not ocr_is_weak(result, log_txt):
+            break
+    return result, log_txt, model, res, truncated
+
+
+def translation_is_weak(french_text: str, english_text: str, log_txt: str) -> bool:
+    """Cheap check for a missing, truncated or refused translation"""
+    if "</output>" not in log_txt or REFUSAL_PATTERN.match(english_text):
+        return True
+    return len(english_text) < 0.5 * len(french_text.strip())
+
+
+def translate_text_routed(client, french_text):
+    """Translate from the translation memory when every sentence is known,
+    otherwise with the routed models, escalating on weak results. Blank
+    pages need no translation."""
+    english_text, hints = default_translation_memory().translate_page(french_text)
+    if english_text == "":
+        print("Blank page, nothing to translate")
+        return "", "", "", False
+    if english_text is not None:
+        print(f"Translated {len(french_text)} characters from translation memory")
+        return english_text, "", "translation-memory", False
+
+    max_tokens = translation_budget(french_text)
+    for model in translation_plan(french_text):
+        result, log_txt, truncated = translate_text(
+            client, french_text, model, max_tokens, hints
+        )
+        print(f"Translated {len(french_text)} characters with {model}")
+        if not translation_is_weak(french_text, result, log_txt):
+            break
+    return result, log_txt, model, truncated
 
 
 @friendly_retries
-def translate_text(client, french_text):
-    response = client.messages.create(
-        model=cfg.MODEL_ID,
-        max_tokens=4000,
+def translate_text(
+    client, french_text, model=cfg.MODEL_ID, max_tokens=cfg.MAX_TOKENS_CAP, hints=()
+):
+    hint_text = ""
+    if hints:
+        hint_lines = "\n".join(f"{fr} => {en}" for fr, en in hints)
+        hint_text = (
+            cfg.TRANSLATION_HINTS_PROMPT + f"<hints>\n{hint_lines}\n</hints>\n\n"
+        )
+    response, truncated = _create_with_budget(
+        client,
+        max_tokens,
+        model=model,
         temperature=1,
         system="You are an expert academic translator and historian specializing in 18th Century French.",
         messages=[
@@ -109,7 +227,10 @@ def translate_text(client, french_text):
                 "content": [
                     {
                         "type": "text",
-                        "text": cfg.TRANSLATION_PROMPT + "\n\n" + french_text,
+                        "text": cfg.TRANSLATION_PROMPT
+                        + "\n\n"
+                        + hint_text
+                        + french_text,
                     }
                 ],
             },
@@ -118,7 +239,7 @@ def translate_text(client, french_text):
     )
     log_txt = response.content[0].text
     result = _extract_output(response.content[0].text)
-    return result, log_txt
+    return result, log_txt, truncated
 
 
 def format_text(client, text: str):
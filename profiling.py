@@ -0,0 +1,145 @@
+import json
+import os
+import threading
+import time
+import tracemalloc
+from pathlib import Path
+
+_enabled = False
+_events = []
+_lock = threading.Lock()
+_local = threading.local()
+_t0 = 0.0
+
+
+class _NullSpan:
+    """Stand-in returned by span when profiling is off, so instrumented code
+    costs one function call and can still set attributes like nbytes"""
+
+    nbytes = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_exc):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span:
+    def __init__(self, name: str, page: str = None, nbytes: int = 0):
+        self.name = name
+        self.page = page
+        self.nbytes = nbytes
+        self.peak = 0
+
+    def __enter__(self):
+        stack = _stack()
+        if self.page is None and stack:
+            self.page = stack[-1].page
+        self.memory, peak = tracemalloc.get_traced_memory()
+        if stack:
+            # the enclosing span's peak so far is lost by the reset below
+            stack[-1].peak = max(stack[-1].peak, peak)
+        stack.append(self)
+        tracemalloc.reset_peak()
+        self.wall = time.perf_counter()
+        self.cpu = time.thread_time()
+        return self
+
+    def __exit__(self, *_exc):
+        wall = time.perf_counter() - self.wall
+        cpu = time.thread_time() - self.cpu
+        self.peak = max(self.peak, tracemalloc.get_traced_memory()[1])
+        stack = _stack()
+        stack.pop()
+        if stack:
+            # resetting the peak for this span hid it from the enclosing one
+            stack[-1].peak = max(stack[-1].peak, self.peak)
+        event = {
+            "name": self.name,
+            "page": self.page,
+            "start": self.wall - _t0,
+            "wall": wall,
+            "cpu": cpu,
+            "bytes": self.nbytes,
+            # peak traced memory above what was allocated when the span began
+            "peak": self.peak - self.memory,
+            "tid": threading.get_ident(),
+        }
+        with _lock:
+            _events.append(event)
+        return False
+
+
+def _stack() -> list:
+    if not hasattr(_local, "stack"):
+        _local.stack = []
+    return _local.stack
+
+
+def enable():
+    """Start recording spans. Memory peaks are process wide, so they are
+    only exact when pages are processed one at a time."""
+    global _enabled, _t0
+    _enabled = True
+    _t0 = time.perf_counter()
+    tracemalloc.start()
+
+
+def span(name: str, page: str = None, nbytes: int = 0):
+    """Time a stage. Spans without a page inherit it from the enclosing span."""
+    if not _enabled:
+        return _NULL_SPAN
+    return _Span(name, page, nbytes)
+
+
+def report() -> str:
+    """Aggregate table of recorded spans per stage. peak MB is the largest
+    rise in traced memory during any one span of the stage."""
+    stages = {}
+    for e in _events:
+        s = stages.setdefault(e["name"], [0, 0.0, 0.0, 0, 0])
+        s[0] += 1
+        s[1] += e["wall"]
+        s[2] += e["cpu"]
+        s[3] += e["bytes"]
+        s[4] = max(s[4], e["peak"])
+
+    lines = [
+        f"{'stage':<20}{'count':>8}{'wall s':>10}{'mean ms':>10}"
+        f"{'cpu s':>10}{'MB':>10}{'peak MB':>10}"
+    ]
+    for name, (n, wall, cpu, nbytes, peak) in sorted(
+        stages.items(), key=lambda x: -x[1][1]
+    ):
+        lines.append(
+            f"{name:<20}{n:>8}{wall:>10.2f}{1000 * wall / n:>10.1f}"
+            f"{cpu:>10.2f}{nbytes / 1e6:>10.1f}{peak / 1e6:>10.1f}"
+        )
+    return "\n".join(lines)
+
+
+def write_trace(path: Path):
+    """Write recorded spans as a Chrome trace (chrome://tracing, Perfetto)"""
+    trace = [
+        {
+            "name": e["name"],
+            "ph": "X",
+            "ts": e["start"] * 1e6,
+            "dur": e["wall"] * 1e6,
+            "pid": os.getpid(),
+            "tid": e["tid"],
+            "args": {
+                "page": e["page"],
+                "cpu_ms": e["cpu"] * 1e3,
+                "bytes": e["bytes"],
+                "peak_bytes": e["peak"],
+            },
+        }
+        for e in _events
+    ]
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"traceEvents": trace}, f)
@@ -0,0 +1,95 @@
+import io
+from dataclasses import dataclass
+
+from PIL import Image
+
+import config as cfg
+
+
+@dataclass
+class PageFeatures:
+    ink_density: float
+    n_lines: int
+
+
+def _percentile(values: list[int], q: float) -> int:
+    return sorted(values)[int(q * (len(values) - 1))]
+
+
+def _extent(profile: list[int], threshold: float) -> tuple[int, int]:
+    """First and last+1 index of the profile above the threshold"""
+    inside = [i for i, v in enumerate(profile) if v > threshold]
+    return (inside[0], inside[-1] + 1) if inside else (0, 0)
+
+
+def page_features(image_data: bytes) -> PageFeatures:
+    """Cheap local features of a greyscale page image"""
+    with Image.open(io.BytesIO(image_data)) as img:
+        page = img.convert("L")
+    hist = page.histogram()
+    total, seen = page.width * page.height, 0
+    for paper, n in enumerate(hist):
+        seen += n
+        if seen >= cfg.PAPER_PERCENTILE * total:
+            break
+
+    # crop dark scanner borders and the book edge, which read as solid ink
+    cols = list(page.resize((page.width, 1), Image.Resampling.BOX).tobytes())
+    x0, x1 = _extent(cols, cfg.MARGIN_RATIO * paper)
+    if x0 == x1:
+        return PageFeatures(0.0, 0)
+    page = page.crop((x0, 0, x1, page.height))
+    rows = list(page.resize((1, page.height), Image.Resampling.BOX).tobytes())
+    y0, y1 = _extent(rows, cfg.MARGIN_RATIO * paper)
+    if y0 == y1:
+        return PageFeatures(0.0, 0)
+    page = page.crop((0, y0, page.width, y1))
+
+    ink = page.point(lambda p: 255 if p < cfg.INK_RATIO * paper else 0)
+    ink_density = ink.histogram()[255] / (ink.width * ink.height)
+
+    # fraction of ink per row; a text line is a band of at least two rows
+    # well above the gaps, relative to the most inked rows of the page
+    profile = list(ink.resize((1, ink.height), Image.Resampling.BOX).tobytes())
+    ref = _percentile(profile, 0.9)
+    if ref == 0:
+        return PageFeatures(ink_density, 0)
+    n_lines = height = 0
+    for row in profile + [0]:
+        if row > cfg.LINE_GAP_RATIO * ref:
+            height += 1
+            continue
+        if height >= 2:
+            n_lines += 1
+        height = 0
+    return PageFeatures(ink_density, n_lines)
+
+
+def ocr_plan() -> list[tuple[str, int]]:
+    """
+    Ordered (model, resolution) attempts for OCR. The corpus is handwritten,
+    which the lite model transcribes noticeably worse, so OCR stays on the
+    full model and only escalates up the resolution ladder.
+    """
+    return [(cfg.MODEL_ID, res) for res in cfg.OCR_RESOLUTIONS]
+
+
+def translation_plan(french_text: str) -> list[str]:
+    """Ordered models to attempt for translation"""
+    if len(french_text) <= cfg.ROUTE_LITE_MAX_FRENCH_CHARS:
+        return [cfg.LITE_MODEL_ID, cfg.MODEL_ID]
+    return [cfg.MODEL_ID]
+
+
+def ocr_budget(features: PageFeatures) -> int:
+    """max_tokens for OCR, covering the thinking and the transcription"""
+    budget = cfg.OCR_BASE_TOKENS + cfg.OCR_TOKENS_PER_LINE * features.n_lines
+    return min(budget, cfg.MAX_TOKENS_CAP)
+
+
+def translation_budget(french_text: str) -> int:
+    """max_tokens for translation, covering the thinking and the translation"""
+    budget = cfg.TRANSLATION_BASE_TOKENS + int(
+        cfg.TRANSLATION_TOKENS_PER_CHAR * len(french_text)
+    )
+    return min(budget, cfg.MAX_TOKENS_CAP)
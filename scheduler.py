@@ -0,0 +1,79 @@
+import copy
+from dataclasses import dataclass, field
+from datetime import datetime
+
+
+@dataclass
+class FolderJob:
+    name: str
+    pages: list[int]
+    priority: int = 0
+    deadline: datetime = None
+    # stride scheduling pass value, advanced by 1 / weight on every dispatch
+    pass_value: float = 0.0
+    done: int = 0
+    total: int = field(init=False)
+
+    def __post_init__(self):
+        self.total = len(self.pages)
+
+    @property
+    def weight(self) -> int:
+        return 1 + max(self.priority, 0)
+
+
+class FolderScheduler:
+    """
+    Chooses which folder's page to process next. Folders with a deadline go
+    first, earliest deadline first. The rest share the workers in proportion
+    to 1 + priority (stride scheduling), so every folder makes progress. With
+    shortest_first, the folder with the fewest remaining pages goes next, so
+    complete journals are delivered sooner.
+    """
+
+    def __init__(self, jobs: list[FolderJob], shortest_first: bool = False):
+        self.jobs = {job.name: job for job in jobs if job.pages}
+        self.shortest_first = shortest_first
+
+    def _key(self, job: FolderJob):
+        deadline = job.deadline.timestamp() if job.deadline else float("inf")
+        remaining = len(job.pages) if self.shortest_first else 0
+        return (deadline, remaining, job.pass_value, -job.priority)
+
+    def next(self):
+        """Next (folder, page) to process, or None when all are dispatched"""
+        pending = [job for job in self.jobs.values() if job.pages]
+        if not pending:
+            return None
+        job = min(pending, key=self._key)
+        job.pass_value += 1 / job.weight
+        return job.name, job.pages.pop(0)
+
+    def finished(self, folder: str):
+        self.jobs[folder].done += 1
+
+    def estimate_completion(self, seconds_per_page: float, workers: int) -> dict:
+        """Seconds until each folder's pages are all done, found by replaying
+        the schedule with pages taking seconds_per_page on workers workers"""
+        sim = copy.deepcopy(self)
+        clock = 0.0
+        etas = {name: 0.0 for name in self.jobs}
+        while (item := sim.next()) is not None:
+            clock += seconds_per_page / workers
+            etas[item[0]] = clock
+        # pages already in flight still need finishing
+        return {name: eta + seconds_per_page for name, eta in etas.items()}
+
+    def status(self, seconds_per_page: float, workers: int) -> str:
+        etas = self.estimate_completion(seconds_per_page, workers)
+        now = datetime.now()
+        lines = []
+        for job in self.jobs.values():
+            if job.done == job.total:
+                continue
+            eta = datetime.fromtimestamp(now.timestamp() + etas[job.name])
+            lines.append(
+                f"{job.name:<30}{job.done:>6}/{job.total:<6}"
+                f"ETA {eta:%Y-%m-%d %H:%M}"
+            )
+        return "\n".join(lines)
@@ -0,0 +1,168 @@
+import json
+import re
+import unicodedata
+from collections import Counter
+from functools import cache
+from pathlib import Path
+
+import config as cfg
+
+TM_PATH = Path("translation-memory.json")
+
+
+def normalize(segment: str) -> str:
+    """Fuzzy key for a segment: case, accents, long s, punctuation and
+    spacing are ignored. Digits are kept, so dates only match exactly."""
+    s = unicodedata.normalize("NFKD", segment.replace("ſ", "s"))
+    s = "".join(c for c in s if not unicodedata.combining(c)).lower()
+    return " ".join(re.sub(r"[^\w\s]", " ", s).split())
+
+
+# a sentence ends at . ! or ? after a word of three or more letters, so not
+# after initials and abbreviations like "M." or "Mr.", before the next word
+SENTENCE_END = re.compile(r"(?<=[^\W\d_]{3}[.!?])(\s+)(?=[^\W\d_])")
+
+
+def _segments(text: str) -> list[tuple[str, str]]:
+    """
+    Sentences of a page, with paragraphs also ending a segment, each paired
+    with the separator that follows it in the page (a blank line, a line
+    break or a space) so a page can be rebuilt with the same breaks.
+    """
+    segments = []
+    for paragraph in re.split(r"\n\s*\n", text.strip()):
+        # split alternates sentences and the whitespace captured between them
+        parts = SENTENCE_END.split(paragraph)
+        for sentence, sep in zip(parts[::2], parts[1::2] + [""]):
+            if sentence.strip():
+                sep = "\n" if "\n" in sep else " "
+                segments.append([" ".join(sentence.split()), sep])
+        if segments:
+            segments[-1][1] = "\n\n"
+    if segments:
+        segments[-1][1] = ""
+    return [(sentence, sep) for sentence, sep in segments]
+
+
+def _aligned(french_segments: list[str], english_segments: list[str]) -> bool:
+    """Whether a page's segments can be paired up in order: the counts match
+    and every pair has a plausible length ratio"""
+    if len(french_segments) != len(english_segments):
+        return False
+    return all(
+        1 / cfg.TM_MAX_LENGTH_RATIO <= len(en) / len(fr) <= cfg.TM_MAX_LENGTH_RATIO
+        for fr, en in zip(french_segments, english_segments)
+    )
+
+
+def build_translation_memory(raw_data: dict) -> dict:
+    """
+    Collect sentence-level French -> English pairs from read_raw_files style
+    input. Only pages whose segments are _aligned are used. French segments
+    of fewer than TM_MIN_WORDS words are dropped, as fragments like "Le" or
+    "que" have no translation of their own. A segment is kept, in its most
+    common spelling, when its normalized form occurs at least
+    TM_MIN_OCCURRENCES times and most occurrences share one English.
+    """
+    spellings = {}
+    pairs = {}
+    for files in raw_data.values():
+        for french, english, _im_name, _im in files:
+            french_segments = [s for s, _sep in _segments(french)]
+            english_segments = [s for s, _sep in _segments(english)]
+            if not _aligned(french_segments, english_segments):
+                continue
+            for fr, en in zip(french_segments, english_segments):
+                if len(fr.split()) < cfg.TM_MIN_WORDS:
+                    continue
+                key = normalize(fr)
+                spellings.setdefault(key, Counter())[fr] += 1
+                pairs.setdefault(key, Counter())[en] += 1
+
+    memory = {}
+    for key, translations in pairs.items():
+        count = sum(translations.values())
+        english, agreeing = translations.most_common(1)[0]
+        if count >= cfg.TM_MIN_OCCURRENCES and 2 * agreeing > count:
+            memory[spellings[key].most_common(1)[0][0]] = [english, count]
+    return memory
+
+
+class TranslationMemory:
+    """Exact and normalized lookup of previously translated sentences, with
+    hit counts for reporting"""
+
+    def __init__(self, memory: dict):
+        self.exact = {fr: en for fr, (en, _count) in memory.items()}
+        self.fuzzy = {}
+        # the most frequent segment wins a normalized key
+        for fr, (en, _count) in sorted(memory.items(), key=lambda x: x[1][1]):
+            self.fuzzy[normalize(fr)] = en
+        self.stats = Counter()
+
+    def lookup(self, segment: str):
+        segment = " ".join(segment.split())
+        if segment in self.exact:
+            self.stats["exact"] += 1
+            return self.exact[segment]
+        match = self.fuzzy.get(normalize(segment))
+        self.stats["fuzzy" if match is not None else "miss"] += 1
+        return match
+
+    def translate_page(self, french_text: str):
+        """
+        Look up every segment of a page. Returns the full English page if all
+        segments are known, otherwise None and the known (French, English)
+        pairs to use as hints. Blank pages are counted separately and come
+        back as an empty translation.
+        """
+        segments = _segments(french_text)
+        if not segments:
+            self.stats["blank_pages"] += 1
+            return "", []
+
+        parts = []
+        hints = []
+        complete = True
+        for french, sep in segments:
+            english = self.lookup(french)
+            if english is None:
+                complete = False
+            else:
+                parts.append(english + sep)
+                hints.append((french, english))
+
+        self.stats["pages"] += 1
+        if complete:
+            self.stats["pages_served"] += 1
+            return "".join(parts), hints
+        return None, hints
+
+    def report(self) -> str:
+        lookups = self.stats["exact"] + self.stats["fuzzy"] + self.stats["miss"]
+        blank = f", {self.stats['blank_pages']} blank pages skipped"
+        if lookups == 0:
+            return "Translation memory: no lookups" + blank
+        hits = self.stats["exact"] + self.stats["fuzzy"]
+        return (
+            f"Translation memory: {hits}/{lookups} sentences matched "
+            f"({100 * hits / lookups:.1f}%, {self.stats['exact']} exact, "
+            f"{self.stats['fuzzy']} fuzzy), {self.stats['pages_served']}/"
+            f"{self.stats['pages']} non-blank pages translated without the "
+            f"model" + blank
+        )
+
+
+def save_translation_memory(memory: dict, path: Path = TM_PATH):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(memory, f, ensure_ascii=False)
+
+
+@cache
+def default_translation_memory(path: Path = TM_PATH) -> TranslationMemory:
+    """The translation memory built by build-tm, or an empty one"""
+    memory = {}
+    if path.exists():
+        with open(path, "r", encoding="utf-8") as f:
+            memory = json.load(f)
+    return TranslationMemory(memory)
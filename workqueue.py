@@ -0,0 +1,111 @@
+import os
+import socket
+import sqlite3
+import time
+from pathlib import Path
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS pages (
+    folder TEXT NOT NULL,
+    page INTEGER NOT NULL,
+    override INTEGER NOT NULL DEFAULT 0,
+    status TEXT NOT NULL DEFAULT 'pending',
+    worker TEXT,
+    lease_expires REAL,
+    PRIMARY KEY (folder, page)
+)
+"""
+
+
+def default_worker_id() -> str:
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+class WorkQueue:
+    """
+    Durable queue of pages to process, backed by a SQLite file. Pages are
+    identified by folder and page number, so enqueueing a page that is
+    already queued just marks it pending again.
+
+    Several workers, possibly on different machines, can share one queue
+    file. A claimed page is leased to its worker for lease_seconds; workers
+    renew the leases of pages in flight, and pages whose lease expired
+    (because the worker crashed) can be claimed again. Shared storage must
+    support SQLite's file locking.
+    """
+
+    def __init__(self, path: Path, worker: str = None, lease_seconds: float = 600):
+        self.worker = worker or default_worker_id()
+        self.lease_seconds = lease_seconds
+        # wait on other workers holding the lock rather than failing
+        self.conn = sqlite3.connect(path, timeout=60)
+        with self.conn:
+            self.conn.execute(SCHEMA)
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_exc):
+        self.close()
+
+    def enqueue(self, folder: str, pages, override: bool = False):
+        with self.conn:
+            self.conn.executemany(
+                "INSERT INTO pages (folder, page, override) VALUES (?, ?, ?) "
+                "ON CONFLICT (folder, page) DO UPDATE SET status = 'pending', "
+                "override = MAX(override, excluded.override)",
+                [(folder, page, int(override)) for page in pages],
+            )
+
+    def claim(self, n: int) -> list[tuple[str, int, bool]]:
+        """Lease up to n pending or abandoned pages and return them"""
+        now = time.time()
+        with self.conn:
+            # take the write lock up front so two workers can't claim a page
+            self.conn.execute("BEGIN IMMEDIATE")
+            rows = self.conn.execute(
+                "SELECT folder, page, override FROM pages WHERE status = 'pending' "
+                "OR (status = 'running' AND lease_expires < ?) "
+                "ORDER BY folder, page LIMIT ?",
+                (now, n),
+            ).fetchall()
+            self.conn.executemany(
+                "UPDATE pages SET status = 'running', worker = ?, lease_expires = ? "
+                "WHERE folder = ? AND page = ?",
+                [
+                    (self.worker, now + self.lease_seconds, folder, page)
+                    for folder, page, _ in rows
+                ],
+            )
+        return [(folder, page, bool(override)) for folder, page, override in rows]
+
+    def renew(self, pages: list[tuple[str, int]]):
+        """Extend the leases of pages this worker still has in flight"""
+        expires = time.time() + self.lease_seconds
+        with self.conn:
+            self.conn.executemany(
+                "UPDATE pages SET lease_expires = ? "
+                "WHERE folder = ? AND page = ? AND worker = ? AND status = 'running'",
+                [(expires, folder, page, self.worker) for folder, page in pages],
+            )
+
+    def finish(self, folder: str, page: int, ok: bool = True):
+        status = "done" if ok else "failed"
+        with self.conn:
+            self.conn.execute(
+                "UPDATE pages SET status = ?, override = 0, lease_expires = NULL "
+                "WHERE folder = ? AND page = ? AND worker = ? AND status = 'running'",
+                (status, folder, page, self.worker),
+            )
+
+    def outstanding(self, folder: str = None) -> int:
+        """Number of pages, of a folder or overall, still pending or running"""
+        query = "SELECT COUNT(*) FROM pages WHERE status IN ('pending', 'running')"
+        if folder is None:
+            (n,) = self.conn.execute(query).fetchone()
+        else:
+            (n,) = self.conn.execute(query + " AND folder = ?", (folder,)).fetchone()
+        return n